@@ -6,19 +6,215 @@ import json
 from io import BytesIO
 from PIL import Image
 import time
+import socket
+import threading
+from concurrent.futures import Future, wait
+from functools import partial
+import urllib3
+from requests.adapters import HTTPAdapter
 
 from api_key import api_key
 
 TOGETHER_API_URL = "https://api.together.xyz/v1/chat/completions"
 MODEL_NAME = "meta-llama/Llama-Vision-Free"
 
+ANALYSIS_TIMEOUT_SECONDS = 120
+CONNECT_TIMEOUT_SECONDS = 10
+PROGRESS_POLL_SECONDS = 0.05
+PROGRESS_KEEPALIVE_SECONDS = 1.0
+
+class AnalysisCancelled(Exception):
+    """Raised when an analysis is abandoned, superseded or runs past its deadline"""
+
+class ProviderError(Exception):
+    """Error event sent by the provider in the middle of a stream"""
+
+class CancellationToken:
+    """Cancellation flag and end-to-end deadline shared by one analysis"""
+
+    def __init__(self, timeout=ANALYSIS_TIMEOUT_SECONDS):
+        self.deadline = time.monotonic() + timeout
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the analysis and release everything registered with on_cancel"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        """Run callback on cancellation, immediately if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return callback
+        callback()
+        return callback
+
+    def discard(self, callback):
+        """Forget a callback registered with on_cancel that is no longer needed"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self):
+        """Raise AnalysisCancelled if cancelled or past the deadline"""
+        if not self._event.is_set() and self.remaining() <= 0:
+            self.cancel("deadline exceeded")
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason)
+
+    def sleep(self, seconds):
+        """Sleep that wakes up as soon as the analysis is cancelled"""
+        self._event.wait(min(seconds, self.remaining()))
+        self.check()
+
 def encode_image_to_base64(image_data):
     """Convert image data to base64 string"""
     return base64.b64encode(image_data).decode('utf-8')
 
-def analyze_medical_image(image_data, system_prompt):
+def abort_connection(sock):
+    """Shut the socket down so a thread blocked on it wakes up immediately"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+class AbortableConnectionMixin:
+    """urllib3 connection that hands its socket to on_connect once connected"""
+
+    def __init__(self, *args, on_connect=None, **kwargs):
+        self.on_connect = on_connect
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        super().connect()
+        if self.on_connect is not None:
+            self.on_connect(self.sock)
+
+class AbortableHTTPConnection(AbortableConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+class AbortableHTTPSConnection(AbortableConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+class AbortableHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = AbortableHTTPConnection
+
+class AbortableHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = AbortableHTTPSConnection
+
+class AbortableAdapter(HTTPAdapter):
+    """requests transport adapter that reports every socket it opens, proxied or not"""
+
+    def __init__(self, on_connect):
+        self.on_connect = on_connect
+        super().__init__()
+
+    def use_abortable_pools(self, manager):
+        # Extra pool keyword arguments are passed through to the connection
+        manager.pool_classes_by_scheme = {
+            "http": partial(AbortableHTTPConnectionPool, on_connect=self.on_connect),
+            "https": partial(AbortableHTTPSConnectionPool, on_connect=self.on_connect),
+        }
+        return manager
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.use_abortable_pools(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS proxies bring connection pools of their own
+        if not proxy.lower().startswith("socks"):
+            self.use_abortable_pools(manager)
+        return manager
+
+def stream_completion(payload, headers, token):
+    """POST a streaming chat completion, aborting the connection on cancellation"""
+    token.check()
+    aborts = []
+    
+    def on_connect(sock):
+        # Keep the socket object itself: shutting it down interrupts the
+        # upload, the wait for the first token and the body read alike, and
+        # unlike a raw fd it can never refer to another session's connection.
+        aborts.append(token.on_cancel(lambda: abort_connection(sock)))
+    
+    # Socket timeouts are per operation, so a provider trickling bytes could
+    # keep the read alive past the deadline when no poller calls check();
+    # cancelling at the deadline aborts every socket the analysis opened.
+    deadline_timer = threading.Timer(token.remaining(), token.cancel, args=("deadline exceeded",))
+    deadline_timer.daemon = True
+    deadline_timer.start()
+    
+    with requests.Session() as session:
+        adapter = AbortableAdapter(on_connect)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        try:
+            remaining = token.remaining()
+            response = session.post(
+                TOGETHER_API_URL,
+                headers=headers,
+                json=payload,
+                stream=True,
+                timeout=(min(CONNECT_TIMEOUT_SECONDS, remaining), remaining)
+            )
+            with response:
+                response.raise_for_status()
+                content = []
+                for line in response.iter_lines():
+                    token.check()
+                    line = line.decode('utf-8').strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get('error'):
+                        error = chunk['error']
+                        raise ProviderError(error.get('message') or error if isinstance(error, dict) else error)
+                    # Usage-only and other bookkeeping chunks carry no choices
+                    if not chunk.get('choices'):
+                        continue
+                    delta = chunk['choices'][0].get('delta') or {}
+                    content.append(delta.get('content') or "")
+        finally:
+            deadline_timer.cancel()
+            for abort in aborts:
+                token.discard(abort)
+    
+    token.check()
+    return "".join(content)
+
+def analyze_medical_image(image_data, system_prompt, token=None):
     """Send image to Together AI for analysis"""
+    if token is None:
+        token = CancellationToken()
+    token.check()
     base64_image = encode_image_to_base64(image_data)
+    token.check()
     
     headers = {
         "Authorization": f"Bearer {api_key}",
@@ -51,23 +247,44 @@ def analyze_medical_image(image_data, system_prompt):
         "temperature": 0.4,
         "top_p": 1.0,
         "max_tokens": 4096,
-        "stream": False
+        "stream": True
     }
     
     try:
-        response = requests.post(TOGETHER_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content']
-    
-    except requests.exceptions.RequestException as e:
-        return f"❌ Error calling Together AI API: {str(e)}"
-    except KeyError as e:
-        return f"❌ Error parsing API response: {str(e)}"
+        return stream_completion(payload, headers, token)
+    
+    except AnalysisCancelled:
+        raise
     except Exception as e:
+        # Aborting the connection from another thread, or hitting the deadline
+        # mid-read, surfaces as an arbitrary error; report the cancellation.
+        try:
+            token.check()
+        except AnalysisCancelled as cancelled:
+            raise cancelled from e
+        if isinstance(e, requests.exceptions.RequestException):
+            return f"❌ Error calling Together AI API: {str(e)}"
+        if isinstance(e, ProviderError):
+            return f"❌ Together AI API reported an error: {str(e)}"
+        if isinstance(e, (KeyError, IndexError, ValueError)):
+            return f"❌ Error parsing API response: {str(e)}"
         return f"❌ Unexpected error: {str(e)}"
 
-def display_typing_effect(text, container, typing_speed=0.03):
+def start_analysis(image_data, system_prompt, token):
+    """Run analyze_medical_image on a worker thread of its own and return its Future"""
+    future = Future()
+    
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(analyze_medical_image(image_data, system_prompt, token))
+        except Exception as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, name="analysis", daemon=True).start()
+    return future
+
+def display_typing_effect(text, container, typing_speed=0.03, token=None):
     """Display text with typing effect and blinking cursor"""
     cursor_html = """
     <style>
@@ -104,7 +321,13 @@ def display_typing_effect(text, container, typing_speed=0.03):
         """
         
         container.markdown(html_content, unsafe_allow_html=True)
-        time.sleep(typing_speed)
+        if token is None:
+            time.sleep(typing_speed)
+        elif token.remaining() <= typing_speed:
+            # Out of time: skip the rest of the animation, not the result
+            break
+        else:
+            token.sleep(typing_speed)
     
 
     final_html = f"""
@@ -117,6 +340,65 @@ def display_typing_effect(text, container, typing_speed=0.03):
     """
     container.markdown(final_html, unsafe_allow_html=True)
 
+def show_results_section():
+    """Render the results header and return the container the report is typed into"""
+    st.markdown("""
+    <div class="results-section">
+        <div class="results-title">📋 Analysis Results</div>
+    </div>
+    """, unsafe_allow_html=True)
+    
+
+    st.markdown("### 🤖 AI Analysis in Progress...")
+    return st.empty()
+
+def run_analysis(uploaded_file, token, progress_bar, status_text, open_results, typing_speed=0.02):
+    """Everything "Analyze Image" does: analysis with live progress, then the typed report"""
+    # Streamlit interrupts the script at the next st.* call when the user
+    # uploads another image, reruns or disconnects; the finally below then
+    # cancels the token so the worker and its connection are released.
+    try:
+        image_data = uploaded_file.getvalue()
+        future = start_analysis(image_data, system_prompt, token)
+        
+        i = 0
+        shown = None
+        last_update = 0.0
+        while not future.done():
+            if i < 30:
+                label = "🔍 Analyzing image structure..."
+            elif i < 60:
+                label = "🧠 Running AI analysis..."
+            else:
+                label = "📊 Generating report..."
+        
+            # Only send deltas when the bar or label changes; once the bar
+            # stalls at 90% a slow keep-alive is still a point at which
+            # Streamlit can interrupt this run.
+            if (i, label) != shown or time.monotonic() - last_update >= PROGRESS_KEEPALIVE_SECONDS:
+                progress_bar.progress(i + 1)
+                if shown is None or label != shown[1]:
+                    status_text.text(label)
+                shown = (i, label)
+                last_update = time.monotonic()
+        
+            i = min(i + 1, 89)
+            wait([future], timeout=min(PROGRESS_POLL_SECONDS, token.remaining()))
+            token.check()
+        
+        progress_bar.progress(100)
+        status_text.text("✅ Analysis complete!")
+        analysis_result = future.result()
+        
+        progress_bar.empty()
+        status_text.empty()
+        
+        typing_container = open_results()
+        display_typing_effect(analysis_result, typing_container, typing_speed=typing_speed, token=token)
+        return analysis_result
+    finally:
+        token.cancel("finished")
+
 system_prompt = """
 System Prompt for AI Medical Image Analyst Model:
 
@@ -534,39 +816,7 @@ if submit_button:
         
         try:
 
-            for i in range(100):
-                progress_bar.progress(i + 1)
-                if i < 30:
-                    status_text.text("🔍 Analyzing image structure...")
-                elif i < 60:
-                    status_text.text("🧠 Running AI analysis...")
-                elif i < 90:
-                    status_text.text("📊 Generating report...")
-                else:
-                    status_text.text("✅ Analysis complete!")
-                
-                time.sleep(0.02)
-            
-            progress_bar.empty()
-            status_text.empty()
-            
-
-            image_data = uploaded_file.getvalue()
-            analysis_result = analyze_medical_image(image_data, system_prompt)
-            
-
-            st.markdown("""
-            <div class="results-section">
-                <div class="results-title">📋 Analysis Results</div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-
-            st.markdown("### 🤖 AI Analysis in Progress...")
-            typing_container = st.empty()
-            
-
-            display_typing_effect(analysis_result, typing_container, typing_speed=0.02)
+            run_analysis(uploaded_file, CancellationToken(), progress_bar, status_text, show_results_section, typing_speed=0.02)
             
 
             with st.sidebar:
@@ -587,6 +837,10 @@ if submit_button:
             
             st.success("✅ Analysis completed successfully! The AI has finished typing the response.")
             
+        except AnalysisCancelled as e:
+            progress_bar.empty()
+            status_text.empty()
+            st.warning(f"⏹️ Analysis stopped: {str(e)}")
         except Exception as e:
             st.error(f"❌ Analysis failed: {str(e)}")
         
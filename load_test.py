@@ -0,0 +1,349 @@
+"""
+Load-test harness for Vital Image Analytics.
+
+Drives N simulated Streamlit sessions through the same analysis path as
+app.py (app.run_analysis: upload -> analysis thread -> provider -> typing effect) against a
+local mock provider, ramping concurrency and reporting memory, threads and
+latency at each level. Every level runs in a fresh process.
+
+    python load_test.py --concurrency 1,2,4,8,16 --sizes 512,1024,2048
+"""
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+MOCK_REPORT_WORD = "finding"
+SAMPLE_INTERVAL_SECONDS = 0.02
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """Streams a canned chat completion the way Together AI does with stream=True"""
+
+    first_token_delay = 1.0
+    response_words = 300
+    words_per_chunk = 8
+    chunk_delay = 0.01
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.first_token_delay)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        try:
+            for sent in range(0, self.response_words, self.words_per_chunk):
+                count = min(self.words_per_chunk, self.response_words - sent)
+                chunk = {"choices": [{"delta": {"content": f"{MOCK_REPORT_WORD} " * count}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(self.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The session cancelled the analysis
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_mock_provider(port_queue, settings):
+    """Run the mock provider; lives in its own process so it does not skew the numbers"""
+    for name, value in settings.items():
+        setattr(MockProviderHandler, name, value)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockProviderHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_mock_provider(settings):
+    """Start the mock provider process and return (process, url)"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_mock_provider, args=(port_queue, settings), daemon=True)
+    process.start()
+    port = port_queue.get(timeout=10)
+    return process, f"http://127.0.0.1:{port}/v1/chat/completions"
+
+
+def load_app(provider_url):
+    """Import app.py without a Streamlit server and point it at the mock provider"""
+    import streamlit.config
+    import streamlit.logger
+
+    # Every st.* call outside a server run warns about the missing script
+    # context; set the option too so a later config parse keeps the level
+    streamlit.config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("error")
+
+    try:
+        import api_key  # noqa: F401
+    except ImportError:
+        # The mock provider accepts any key
+        sys.modules["api_key"] = types.SimpleNamespace(api_key="load-test")
+
+    import app
+    app.TOGETHER_API_URL = provider_url
+    return app
+
+
+def make_image(edge):
+    """JPEG of random noise, which compresses about as poorly as a real scan"""
+    image = Image.frombytes("RGB", (edge, edge), os.urandom(edge * edge * 3))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs (macOS): fall back to the peak, which is reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ResourceSampler(threading.Thread):
+    """Background thread recording peak RSS and thread count"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak_rss = current_rss()
+        self.peak_threads = threading.active_count()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL_SECONDS):
+            self.peak_rss = max(self.peak_rss, current_rss())
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RecordingElement:
+    """Stands in for st.progress()/st.empty(), keeping what a session would hold"""
+
+    def __init__(self):
+        self.value = None
+        self.deltas = 0
+
+    def _update(self, value):
+        self.value = value
+        self.deltas += 1
+
+    def progress(self, value):
+        self._update(value)
+
+    def text(self, body):
+        self._update(body)
+
+    def markdown(self, body, unsafe_allow_html=False):
+        self._update(body)
+
+    def empty(self):
+        self._update(None)
+
+
+def run_session(app, image_data, typing_speed, timeout):
+    """One simulated session: app.run_analysis, as called when "Analyze Image" is pressed"""
+    start = time.perf_counter()
+    upload = BytesIO(image_data)  # the session's UploadedFile, a BytesIO too
+    progress_bar, status_text, results = RecordingElement(), RecordingElement(), RecordingElement()
+    session = {"upload": upload, "results": results, "ok": False, "error": None}
+
+    def open_results():
+        session["time_to_result"] = time.perf_counter() - start
+        return results
+
+    try:
+        result = app.run_analysis(upload, app.CancellationToken(timeout), progress_bar, status_text, open_results, typing_speed)
+        session["ok"] = not result.startswith("❌")
+        if not session["ok"]:
+            session["error"] = result
+    except app.AnalysisCancelled as e:
+        session["error"] = str(e)
+    except Exception as e:
+        session["error"] = f"❌ Analysis failed: {str(e)}"
+
+    session["latency"] = time.perf_counter() - start
+    session["deltas"] = progress_bar.deltas + status_text.deltas + results.deltas
+    return session
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None when there are no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct * len(ordered) / 100) - 1)
+    return ordered[rank]
+
+
+def run_level(app, concurrency, edge, image_data, typing_speed, timeout):
+    """Run `concurrency` sessions at once, all uploading the same image, and summarise the level"""
+    gc.collect()
+    baseline_rss = current_rss()
+    baseline_threads = threading.active_count()
+
+    sampler = ResourceSampler()
+    sampler.start()
+
+    # Sessions stay referenced here until the level is measured, like the
+    # state a live session keeps between reruns
+    sessions = [None] * concurrency
+
+    def worker(index):
+        sessions[index] = run_session(app, image_data, typing_speed, timeout)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f"session-{i}") for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    completed = [s for s in sessions if s["ok"]]
+    # Failed and timed-out sessions count towards latency: leaving them out
+    # would flatter the tail exactly when the process is overloaded
+    latencies = [s["latency"] for s in sessions]
+    times_to_result = [s["time_to_result"] for s in completed]
+    return {
+        "image_edge_px": edge,
+        "image_mib": len(image_data) / 2**20,
+        "concurrency": concurrency,
+        "completed": len(completed),
+        "failed": concurrency - len(completed),
+        "errors": sorted({s["error"] for s in sessions if s["error"]}),
+        "completed_per_s": len(completed) / elapsed if elapsed else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "time_to_result_p50_s": percentile(times_to_result, 50),
+        "rss_baseline_mib": baseline_rss / 2**20,
+        "rss_peak_mib": sampler.peak_rss / 2**20,
+        "rss_per_session_mib": (sampler.peak_rss - baseline_rss) / concurrency / 2**20,
+        "threads_baseline": baseline_threads,
+        "threads_peak": sampler.peak_threads,
+    }
+
+
+def measure_level(result_queue, provider_url, concurrency, edge, image_data, typing_speed, timeout):
+    """Child-process entry point: run one level and send its summary back"""
+    app = load_app(provider_url)
+    if timeout is None:
+        timeout = app.ANALYSIS_TIMEOUT_SECONDS
+    result_queue.put(run_level(app, concurrency, edge, image_data, typing_speed, timeout))
+
+
+def run_level_in_child(provider_url, concurrency, edge, image_data, typing_speed, timeout):
+    """Run one level in a freshly spawned interpreter and return its summary
+
+    Within one process, the allocator keeps the arenas that earlier levels'
+    threads used, so later baselines drift up and RSS per session is
+    under-reported; a fresh process gives every level the same starting point.
+    """
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(
+        target=measure_level,
+        args=(result_queue, provider_url, concurrency, edge, image_data, typing_speed, timeout),
+    )
+    process.start()
+    try:
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"{edge}px x {concurrency} level exited with code {process.exitcode}")
+    finally:
+        process.join()
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_report(levels):
+    header = f"{'image':>6} {'sessions':>8} {'ok':>4} {'fail':>4} {'ok/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'ttr p50':>8} {'RSS MiB':>8} {'MiB/sess':>9} {'threads':>8}"
+    print(header)
+    print("-" * len(header))
+    for level in levels:
+        print(
+            f"{level['image_edge_px']:>4}px {level['concurrency']:>8} {level['completed']:>4} {level['failed']:>4} "
+            f"{level['completed_per_s']:>7.2f} {format_seconds(level['latency_p50_s']):>7} "
+            f"{format_seconds(level['latency_p95_s']):>7} {format_seconds(level['latency_p99_s']):>7} "
+            f"{format_seconds(level['time_to_result_p50_s']):>8} {level['rss_peak_mib']:>8.1f} "
+            f"{level['rss_per_session_mib']:>9.2f} {level['threads_peak']:>8}"
+        )
+
+
+def parse_int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp simulated sessions against a mock provider")
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 2, 4, 8, 16],
+                        help="Comma-separated concurrent session counts to ramp through")
+    parser.add_argument("--sizes", type=parse_int_list, default=[512, 1024, 2048],
+                        help="Comma-separated image edge lengths in pixels; each is ramped separately")
+    parser.add_argument("--typing-speed", type=float, default=0.02,
+                        help="Seconds per word in the typing effect (the app uses 0.02)")
+    parser.add_argument("--timeout", type=float,
+                        help="Per-session analysis deadline in seconds (defaults to the app's)")
+    parser.add_argument("--first-token-delay", type=float, default=1.0,
+                        help="Seconds the mock provider waits before streaming")
+    parser.add_argument("--response-words", type=int, default=300,
+                        help="Words in each mock analysis")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    provider, provider_url = start_mock_provider({
+        "first_token_delay": args.first_token_delay,
+        "response_words": args.response_words,
+    })
+    try:
+        images = [make_image(edge) for edge in args.sizes]
+
+        print(f"Mock provider: {provider_url}")
+        print("Images: " + ", ".join(f"{edge}px = {len(data) / 2**20:.2f} MiB" for edge, data in zip(args.sizes, images)))
+        print()
+
+        levels = []
+        for edge, image_data in zip(args.sizes, images):
+            for concurrency in args.concurrency:
+                levels.append(run_level_in_child(provider_url, concurrency, edge, image_data, args.typing_speed, args.timeout))
+        print_report(levels)
+        for level in levels:
+            for error in level["errors"]:
+                print(f"{level['image_edge_px']}px x {level['concurrency']}: {error}")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"images": {edge: len(data) for edge, data in zip(args.sizes, images)}, "levels": levels}, f, indent=2)
+    finally:
+        provider.terminate()
+
+
+if __name__ == "__main__":
+    main()